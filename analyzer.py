@@ -6,15 +6,15 @@ Analyzer：对图片进行轻量级“AI”分析（真实接入模型可替换
  - w, h: 宽和高
  - primary: 主要对象（这里用文件名占位）
  - object_count: 元素数量（简易估计或模拟）
- - depth_score: 景深评分（模拟或来自深度模型）
- - layers: 分层识别字符串列表（如 "layer1:前景"）
+ - depth_score: 景深评分 0..100（越大越远；清晰度/离焦图 + 垂直位置先验，结果确定可复现）
+ - layers: 分层统计字符串列表（如 "最前景:占比35%_亮度120_清晰42"）
  - all: 所有信息合并字符串
  - aspect_ratio: 长宽比（w/h）
  - pitch_score: 俯仰角估算（简易图像亮度梯度估计）
  - brightness: 图像平均亮度（0-255）
 """
+import io
 from pathlib import Path
-import random
 from PIL import Image, ImageStat, ImageFilter
 
 try:
@@ -22,9 +22,117 @@ try:
 except Exception:
     np = None
 
+# 景深网格：把共享缩小图划分为 DEPTH_GRID x DEPTH_GRID 个区块估计远近
+DEPTH_GRID = 8
+LAYER_NAMES = ("最前景", "中景", "远景")
+SHARP_REF = 8.0        # 拉普拉斯均方根达到该灰度级时清晰度记为 0.5
+SHARP_WEIGHT = 0.6     # 清晰度在远近判断中的权重，其余为垂直位置先验
+NEUTRAL_DEPTH = 50.0   # 无法估计（图太小）时的中性分数
+
+
+def _pool(arr, rows, cols):
+    """把二维数组按块求均值缩到 rows x cols（裁掉除不尽的边缘）"""
+    h, w = arr.shape
+    bh, bw = max(1, h // rows), max(1, w // cols)
+    arr = arr[:bh * rows, :bw * cols]
+    return arr.reshape(rows, bh, cols, bw).mean(axis=(1, 3))
+
+
+def _sharpness(rms):
+    """拉普拉斯响应（灰度级）映射到 0..1 的清晰度，固定参考值，保证不同图片之间可比"""
+    return rms / (rms + SHARP_REF)
+
+
+def _nearness(sharp, row):
+    """清晰且靠下 -> 近；row: 0=顶部, 1=底部"""
+    return SHARP_WEIGHT * sharp + (1 - SHARP_WEIGHT) * row
+
+
+def _layer_text(name, pct, bright, sharp):
+    return f"{name}:占比{pct}%_亮度{int(bright)}_清晰{int(100 * sharp)}"
+
+
+def _depth_layers(gray):
+    """
+    确定性的景深估计（需要 numpy）：
+     - 多尺度拉普拉斯能量 -> 每个区块的清晰度（离焦越严重越小），按固定参考值归一化
+     - 清晰且靠下的区块视为近处，模糊且靠上的区块视为远处
+     - 按相对深度三等分为 最前景/中景/远景，统计各区域占比、亮度、清晰度
+    gray: 0..255 的二维 float 数组
+    返回 (depth_score, layers)
+    """
+    h, w = gray.shape
+    if min(h, w) < 3:
+        return NEUTRAL_DEPTH, []
+    # 窄长图（如全景）按各自方向缩小网格，而不是直接放弃
+    rg = max(1, min(DEPTH_GRID, (h - 2) // 4))
+    cg = max(1, min(DEPTH_GRID, (w - 2) // 4))
+
+    sharp = np.zeros((rg, cg))
+    scales = 0
+    level = gray
+    for _ in range(3):
+        if level.shape[0] - 2 < rg or level.shape[1] - 2 < cg:
+            break
+        lap = (4 * level[1:-1, 1:-1] - level[:-2, 1:-1] - level[2:, 1:-1]
+               - level[1:-1, :-2] - level[1:-1, 2:])
+        sharp += _sharpness(np.sqrt(_pool(lap * lap, rg, cg)))
+        scales += 1
+        level = _pool(level, level.shape[0] // 2, level.shape[1] // 2)
+    sharp /= scales
+
+    rows = (np.arange(rg) + 0.5) / rg
+    depth = 1.0 - _nearness(sharp, rows[:, None])   # 0..1，越大越远
+    depth_score = round(float(depth.mean()) * 100, 2)
+
+    lo, hi = depth.min(), depth.max()
+    rel = (depth - lo) / (hi - lo) if hi > lo else np.zeros_like(depth)
+    region = np.minimum((rel * 3).astype(int), 2)   # 0 前景 1 中景 2 远景
+    bright = _pool(gray, rg, cg)
+    layers = []
+    for i, name in enumerate(LAYER_NAMES):
+        mask = region == i
+        n = int(mask.sum())
+        if n == 0:
+            layers.append(f"{name}:占比0%")
+            continue
+        pct = round(100 * n / mask.size)
+        layers.append(_layer_text(name, pct, bright[mask].mean(), sharp[mask].mean()))
+    return depth_score, layers
+
+
+def _depth_layers_pil(gray):
+    """
+    无 numpy 时的粗略版本：只分上下两半，方向与 _depth_layers 一致（清晰且靠下 -> 近）
+    gray: 共享缩小图的灰度版本
+    """
+    w, h = gray.size
+    if min(w, h) < 3:
+        return NEUTRAL_DEPTH, []
+    # FIND_EDGES 是 8 邻域拉普拉斯，响应约为 4 邻域版本的两倍
+    edges = gray.filter(ImageFilter.FIND_EDGES)
+    halves = []
+    for row, box in ((0.25, (0, 0, w, h // 2)), (0.75, (0, h // 2, w, h))):
+        sharp = _sharpness(ImageStat.Stat(edges.crop(box)).rms[0] / 2)
+        bright = ImageStat.Stat(gray.crop(box)).mean[0]
+        halves.append((1.0 - _nearness(sharp, row), bright, sharp))
+    depth_score = round(100 * sum(d for d, _, _ in halves) / 2, 2)
+    near, far = sorted(halves, key=lambda x: x[0])
+    layers = [
+        _layer_text(LAYER_NAMES[0], 50, near[1], near[2]),
+        f"{LAYER_NAMES[1]}:占比0%",
+        _layer_text(LAYER_NAMES[2], 50, far[1], far[2]),
+    ]
+    return depth_score, layers
+
+
 class Analyzer:
-    def __init__(self, mode="BLIP"):
+    # 共享缩小图的最长边：后续特征与缩略图都从这张图派生，避免重复缩放原图
+    PREVIEW_SIZE = 256
+
+    def __init__(self, mode="BLIP", thumb_cache=None):
         self.mode = mode
+        self.thumb_cache = thumb_cache  # 可选 ThumbCache，分析时顺便写入缩略图
 
     def switch_mode(self, new_mode=None):
         if new_mode:
@@ -33,10 +141,11 @@ class Analyzer:
             self.mode = "ZoeDepth" if self.mode == "BLIP" else "BLIP"
         return self.mode
 
-    def analyze(self, filepath: Path):
+    def analyze(self, filepath: Path, data: bytes = None):
         """
         对单张图片进行分析，优先使用 PIL + numpy 做局部计算（brightness, aspect, pitch）
         对象计数与深度为模拟（可替换为 BLIP / ZoeDepth 的真实实现）
+        data: 已预读的文件内容（见 ReadAhead），提供时直接从内存解码，不再访问磁盘
         """
         p = Path(filepath)
         info = {"filename": p.name}
@@ -48,7 +157,8 @@ class Analyzer:
         info["all"] = p.stem
 
         try:
-            img = Image.open(p).convert("RGB")
+            src = io.BytesIO(data) if data is not None else p
+            img = Image.open(src).convert("RGB")
             w, h = img.size
             info["w"], info["h"] = w, h
             # aspect ratio
@@ -59,9 +169,20 @@ class Analyzer:
             brightness = stat.mean[0] if stat.mean else 0.0
             info["brightness"] = round(float(brightness), 2)
 
+            # 共享缩小图：一次缩放，供特征计算与缩略图缓存复用
+            # 直接缩放到目标尺寸（reducing_gap 先做整数倍快速缩小），不复制全尺寸原图
+            scale = self.PREVIEW_SIZE / max(w, h, 1)
+            if scale < 1:
+                size = (max(1, round(w * scale)), max(1, round(h * scale)))
+                preview = img.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+            else:
+                preview = img
+            if self.thumb_cache is not None:
+                self.thumb_cache.put(p, preview)
+
             # pitch_score: 用简单方法估计“俯仰/倾斜”——垂直亮度梯度的中心偏移
             # 将图像缩小，加速计算
-            small = img.resize((64, 64)).convert("L")
+            small = preview.resize((64, 64)).convert("L")
             if np is not None:
                 arr = np.asarray(small).astype(float)
                 # 计算每行平均亮度，找到亮度重心
@@ -89,16 +210,13 @@ class Analyzer:
             edges = small.filter(ImageFilter.FIND_EDGES)
             est_edges = ImageStat.Stat(edges).sum[0]
             info["object_count"] = int(min(30, max(0, est_edges // 5000)))
-            # depth_score: 随机+亮度/contrast因素简单融合，范围 0..100
-            info["depth_score"] = round(min(100, max(0, info["brightness"] * 0.2 + random.uniform(0,40))), 2)
-
-            # layers：使用中心裁剪和文本占位（真实情况用 BLIP 模型）
-            center = img.crop((w//4, h//4, 3*w//4, 3*h//4)).resize((384,384))
-            info["layers"] = [
-                f"最前景:{p.stem}",
-                f"中景:{p.stem}",
-                f"远景:{p.stem}"
-            ]
+            # depth_score & layers：在共享缩小图上做清晰度/离焦分析（真实情况可换 ZoeDepth）
+            if np is not None:
+                gray = np.asarray(preview.convert("L"), dtype=np.float32)
+                info["depth_score"], info["layers"] = _depth_layers(gray)
+            else:
+                info["depth_score"], info["layers"] = _depth_layers_pil(preview.convert("L"))
+
             info["all"] = f"{info['primary']}|ar={info['aspect_ratio']}|b={info['brightness']}"
         except Exception as e:
             # 如果读图失败，填默认
@@ -112,3 +230,18 @@ class Analyzer:
             info.setdefault("layers", [])
             info.setdefault("all", p.stem)
         return info
+
+    def relabel(self, info: dict, filepath: Path):
+        """
+        把一份分析结果复用到内容相同的另一个文件（去重后的副本）：
+        图像特征不变，只替换与文件名相关的字段
+        """
+        p = Path(filepath)
+        old = Path(info.get("filename", "")).stem
+        out = dict(info)
+        out["filename"] = p.name
+        if out.get("primary") == old:
+            out["primary"] = p.stem
+        if out.get("all", "").startswith(old):
+            out["all"] = p.stem + out["all"][len(old):]
+        return out
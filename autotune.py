@@ -0,0 +1,136 @@
+﻿# core/autotune.py
+"""
+WorkerTuner：运行时自适应调整并发数，取代固定的 max_workers。
+ - 每个测量窗口统计吞吐量（完成数/秒）、进程 CPU 占用与系统 I/O 等待（Linux 读取 /proc/stat）
+ - 爬山式反馈控制：吞吐提升就沿原方向继续调整，下降就反向；CPU 已跑满且不在等 I/O 时不再加线程
+ - 每个存储根（挂载点 / 盘符 / 共享根）分别记住吞吐最高的并发数，下次会话直接从该值开始
+用法：提交任务前 acquire()，任务结束后 release()；线程池按 tuner.hi 创建，实际并发由 tuner 限制。
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+def storage_root(path) -> str:
+    """返回路径所在的挂载点（Windows 为盘符或 UNC 共享根）"""
+    p = Path(path).resolve()
+    for parent in (p, *p.parents):
+        if os.path.ismount(parent):
+            return str(parent)
+    return p.anchor or str(p)
+
+
+def _iowait_sample():
+    """(iowait, total) 的 CPU 时间计数；非 Linux 返回 None"""
+    try:
+        with open("/proc/stat", encoding="ascii") as f:
+            fields = [int(x) for x in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    return fields[4], sum(fields)
+
+
+class WorkerTuner:
+    def __init__(self, kind: str, root: str, initial: int = 4, lo: int = 1, hi: int = None,
+                 store=None, window: float = 2.0):
+        """
+        Args:
+            kind (str): 引擎类型（"analysis" / "copy"），同一存储根下分别记忆
+            root (str): 存储根，见 storage_root()
+            initial (int): 没有历史记录时的起始并发数
+            lo, hi (int): 并发数上下限
+            store: 记忆文件路径（JSON），为 None 时不读写
+            window (float): 测量窗口秒数
+        """
+        self.kind = kind
+        self.root = root
+        self.lo = max(1, lo)
+        self.hi = hi or max(self.lo, (os.cpu_count() or 4) * 4)
+        self.store = Path(store) if store else None
+        self.window = window
+
+        saved = self._load().get(root, {}).get(kind)
+        self.workers = self._clamp(saved or initial)
+        self._best = (self.workers, 0.0)     # (并发数, 吞吐)
+        self._direction = 1
+        self._last_tput = None
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._done = 0
+        self._start_sample()
+
+    def _clamp(self, n):
+        return max(self.lo, min(self.hi, int(n)))
+
+    # -------------------- 并发闸门 --------------------
+    def acquire(self):
+        with self._cond:
+            while self._active >= self.workers:
+                self._cond.wait()
+            self._active += 1
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._done += 1
+            if time.monotonic() - self._t0 >= self.window:
+                self._adjust()
+            self._cond.notify_all()
+
+    # -------------------- 反馈控制 --------------------
+    def _start_sample(self):
+        self._t0 = time.monotonic()
+        self._cpu0 = time.process_time()
+        self._io0 = _iowait_sample()
+        self._done = 0
+
+    def _adjust(self):
+        elapsed = time.monotonic() - self._t0
+        tput = self._done / elapsed
+        cpu = (time.process_time() - self._cpu0) / (elapsed * (os.cpu_count() or 1))
+        iowait = None
+        io1 = _iowait_sample()
+        if self._io0 and io1 and io1[1] > self._io0[1]:
+            iowait = (io1[0] - self._io0[0]) / (io1[1] - self._io0[1])
+
+        # 只有明显更快（>5%）才更新最佳值，吞吐不变时不把随机游走的结果当成最佳
+        if self._best[1] == 0.0 or tput > self._best[1] * 1.05:
+            self._best = (self.workers, tput)
+        if self._last_tput is not None and tput < self._last_tput * 0.95:
+            self._direction = -self._direction
+        if self._direction > 0 and cpu > 0.9 and (iowait is None or iowait < 0.1):
+            self._direction = -1
+        self._last_tput = tput
+
+        step = max(1, self.workers // 4)
+        self.workers = self._clamp(self.workers + self._direction * step)
+        if self.workers in (self.lo, self.hi):
+            # 碰到边界后下一轮从反方向探测
+            self._direction = 1 if self.workers == self.lo else -1
+        self._start_sample()
+
+    @property
+    def best(self) -> int:
+        """目前观测到吞吐最高的并发数"""
+        return self._best[0]
+
+    # -------------------- 记忆 --------------------
+    def _load(self):
+        if self.store is None:
+            return {}
+        try:
+            return json.loads(self.store.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        """把本存储根的最佳并发数写回记忆文件（只有测量过至少一个窗口才写）"""
+        if self.store is None or self._best[1] == 0.0:
+            return
+        data = self._load()
+        data.setdefault(self.root, {})[self.kind] = self.best
+        self.store.parent.mkdir(parents=True, exist_ok=True)
+        self.store.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
@@ -0,0 +1,120 @@
+﻿# core/dedup.py
+"""
+内容去重：分阶段哈希，找出字节完全相同的文件，使每份唯一内容只分析一次。
+  1. 按文件大小分组（只需 stat，大小唯一的文件直接视为唯一内容）
+  2. 同大小的文件比较局部哈希（文件头 + 文件尾各 PARTIAL_BYTES 字节）
+  3. 局部哈希仍相同的文件才计算完整哈希
+"""
+import hashlib
+import os
+from pathlib import Path
+
+PARTIAL_BYTES = 64 * 1024
+CHUNK_BYTES = 1024 * 1024
+
+
+def _partial_hash(p: Path, size: int) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(p, "rb") as f:
+        h.update(f.read(PARTIAL_BYTES))
+        if size > 2 * PARTIAL_BYTES:
+            f.seek(-PARTIAL_BYTES, os.SEEK_END)
+            h.update(f.read(PARTIAL_BYTES))
+    return h.hexdigest()
+
+
+def content_hash(p: Path) -> str:
+    """完整内容哈希（也用于跨分片识别重复文件）"""
+    h = hashlib.blake2b(digest_size=20)
+    with open(p, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _refine(groups: list[list[Path]], hasher) -> list[list[Path]]:
+    """对每个候选组按 hasher 再细分，只保留仍有多个成员的组"""
+    refined = []
+    for paths in groups:
+        buckets = {}
+        for p in paths:
+            try:
+                buckets.setdefault(hasher(p), []).append(p)
+            except OSError:
+                continue
+        refined.extend(b for b in buckets.values() if len(b) > 1)
+    return refined
+
+
+def find_duplicates(paths: list[Path]) -> list[list[Path]]:
+    """
+    找出内容完全相同的文件组。
+
+    Args:
+        paths (list[Path]): 待检查的文件路径
+
+    Returns:
+        list[list[Path]]: 每组至少两个文件，组内保持输入顺序
+    """
+    by_size = {}
+    for p in paths:
+        try:
+            size = os.stat(p).st_size
+        except OSError:
+            continue
+        by_size.setdefault(size, []).append(Path(p))
+    candidates = [g for g in by_size.values() if len(g) > 1]
+
+    # 局部哈希需要知道大小才能决定是否读取文件尾
+    sizes = {p: size for size, g in by_size.items() if len(g) > 1 for p in g}
+    candidates = _refine(candidates, lambda p: _partial_hash(p, sizes[p]))
+    return _refine(candidates, content_hash)
+
+
+def group_by_content(paths: list[Path]) -> dict[Path, list[Path]]:
+    """
+    按内容分组：{代表文件: [代表文件, 副本...]}，唯一文件的组只含自身。
+    代表文件取每组在输入中最先出现的路径。
+    """
+    groups = {Path(p): [Path(p)] for p in paths}
+    for dup in find_duplicates(paths):
+        rep = dup[0]
+        groups[rep] = dup
+        for p in dup[1:]:
+            groups.pop(p, None)
+    return groups
+
+
+def fan_out(analyzer, rep: Path, result: dict, copies: list[Path]) -> dict[str, dict]:
+    """
+    把代表文件的分析结果分发给同组所有副本（GUI / 命令行 / 分片共用，保证字段一致）。
+
+    Args:
+        analyzer: Analyzer，用其 relabel 替换与文件名相关的字段
+        rep (Path): 代表文件
+        result (dict): 代表文件的分析结果
+        copies (list[Path]): 同组全部文件（含代表文件）
+
+    Returns:
+        dict[str, dict]: {str(path): info}，每条补齐 folder / dup_count / dup_of
+    """
+    out = {}
+    for p in copies:
+        info = result if p == rep else analyzer.relabel(result, p)
+        info["folder"] = p.parent.name
+        info["dup_count"] = len(copies)
+        info["dup_of"] = str(rep) if p != rep else ""
+        out[str(p)] = info
+    return out
+
+
+def format_report(duplicates: list[list[Path]]) -> str:
+    """生成可读的重复文件报告"""
+    if not duplicates:
+        return "未发现重复文件"
+    extra = sum(len(g) - 1 for g in duplicates)
+    lines = [f"发现 {len(duplicates)} 组重复文件，共 {extra} 个多余副本"]
+    for i, g in enumerate(duplicates, 1):
+        lines.append(f"[{i}] {len(g)} 份:")
+        lines.extend(f"    {p}" for p in g)
+    return "\n".join(lines)
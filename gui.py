@@ -12,14 +12,24 @@ from PyQt6.QtWidgets import (
     QComboBox, QSpinBox, QCheckBox, QTreeWidget, QTreeWidgetItem,
     QGroupBox, QDialog
 )
-from PyQt6.QtCore import Qt, QMetaObject, Q_ARG, pyqtSlot
+from PyQt6.QtCore import Qt, QMetaObject, Q_ARG, pyqtSlot, QSize, QTimer
+from PyQt6.QtGui import QImage, QPixmap, QIcon
+from PIL import Image
 
 from core.scanner import scan_folder
 from core.analyzer import Analyzer
+from core.dedup import group_by_content, fan_out
+from core.readahead import ReadAhead
+from core.thumbcache import ThumbCache
+from core.service import AnalysisClient, DEFAULT_SOCKET
+from core.autotune import WorkerTuner, storage_root
+from core.shards import merge_shards, write_shard
 from rules.sequences import SequenceGenerator
 from rules.replacer import apply_replacements
 
 CFG_PATH = Path("config/default_cfg.json")
+AUTOTUNE_PATH = Path("config/autotune.json")  # 各存储根记忆的最佳并发数
+THUMB_COL = 3  # 文件列表中缩略图所在列
 
 
 class RenamerWindow(QMainWindow):
@@ -28,14 +38,18 @@ class RenamerWindow(QMainWindow):
         self.setWindowTitle("RenamerAI Pro")
         self.resize(1400, 820)
 
+        self.config = self._load_default_config()
+
         # 核心模块
-        self.analyzer = Analyzer()
+        self.thumb_cache = ThumbCache(self.config.get("thumb_cache_dir", "config/thumbs"),
+                                      max_mb=self.config.get("thumb_cache_mb", 512))
+        self.analyzer = Analyzer(thumb_cache=self.thumb_cache)
         self.seqgen = SequenceGenerator()
 
         # 数据
         self.files = []                 # Path 对象列表
         self.info = {}                  # {str(path): analysis_dict}
-        self.config = self._load_default_config()
+        self.duplicates = []            # [[Path, ...]] 内容相同的文件组
 
         # 初始化 last_folder 为桌面如果为空
         if not self.config.get("last_folder"):
@@ -45,6 +59,14 @@ class RenamerWindow(QMainWindow):
         self._folder_counters = {}      # 子文件夹独立计数
         self.include_subseq = True
 
+        # 缩略图：只为可见行懒加载，缓存未命中时在后台生成
+        self._thumb_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        self._thumb_pending = set()
+        self._thumb_timer = QTimer(self)
+        self._thumb_timer.setSingleShot(True)
+        self._thumb_timer.setInterval(50)
+        self._thumb_timer.timeout.connect(self._fill_visible_thumbs)
+
         # 重命名历史（用于撤销）
         self.rename_history = []  # [(old_path, new_path) for rename, (None, new_path) for copy]
 
@@ -59,7 +81,14 @@ class RenamerWindow(QMainWindow):
             default = {
                 "extensions": [".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tiff", ".gif"],
                 "last_folder": "",
-                "max_workers": 6
+                "max_workers": 4,
+                "autotune": True,
+                "read_ahead_depth": 16,
+                "io_workers": 2,
+                "read_ahead_mb": 256,
+                "thumb_cache_dir": "config/thumbs",
+                "thumb_cache_mb": 512,
+                "daemon_socket": ""
             }
             CFG_PATH.write_text(json.dumps(default, indent=2, ensure_ascii=False), encoding="utf-8")
             return default
@@ -67,6 +96,8 @@ class RenamerWindow(QMainWindow):
 
     def closeEvent(self, event):
         """窗口关闭时保存配置"""
+        self._thumb_pool.shutdown(wait=False, cancel_futures=True)
+        self.thumb_cache.flush()
         CFG_PATH.write_text(json.dumps(self.config, indent=2, ensure_ascii=False), encoding="utf-8")
         super().closeEvent(event)
 
@@ -97,8 +128,10 @@ class RenamerWindow(QMainWindow):
         left.addWidget(self.scan_btn)
 
         self.tree = QTreeWidget()
-        self.tree.setHeaderLabels(["文件", "路径", "预览名"])
+        self.tree.setHeaderLabels(["文件", "路径", "预览名", "缩略图"])
         self.tree.setColumnWidth(0, 500)
+        self.tree.setIconSize(QSize(64, 64))
+        self.tree.verticalScrollBar().valueChanged.connect(lambda _: self._refresh_thumbs())
         left.addWidget(self.tree)
 
         layout.addLayout(left, 0, 0)
@@ -119,7 +152,8 @@ class RenamerWindow(QMainWindow):
             "元素数量(多→少)", "元素数量(少→多)",
             "创建时间(新→旧)", "文件名(自然升序)",
             "同一物体(近→远)",            # ← 新增
-            "同一标志(近→远)"             # ← 新增
+            "同一标志(近→远)",            # ← 新增
+            "重复文件(多→少)", "重复文件(少→多)"
         ]
         for o in sort_options:
             self.sort_list.addItem(o)
@@ -143,6 +177,13 @@ class RenamerWindow(QMainWindow):
         self.btn_start_analysis.clicked.connect(self.start_analysis)
         ai_box.addWidget(self.btn_start_analysis)
 
+        btn_import = QPushButton("导入分析结果（分片）")
+        btn_import.clicked.connect(self.import_results)
+        ai_box.addWidget(btn_import)
+        btn_export = QPushButton("导出分析结果")
+        btn_export.clicked.connect(self.export_results)
+        ai_box.addWidget(btn_export)
+
         self.lbl_mode = QLabel(f"当前模式: {self.analyzer.mode}")
         ai_box.addWidget(self.lbl_mode)
 
@@ -265,6 +306,7 @@ class RenamerWindow(QMainWindow):
             it = QTreeWidgetItem([p.name, str(p.parent), ""])
             it.setData(0, Qt.ItemDataRole.UserRole, str(p))
             self.tree.addTopLevelItem(it)
+        self._refresh_thumbs()
         self.log.append(f"扫描完成，共 {len(self.files)} 个文件")
 
     # ==============================================================
@@ -279,47 +321,151 @@ class RenamerWindow(QMainWindow):
 
     def _analysis_worker(self):
         self.info = {}
-        groups = {}
         for p in self.files:
-            groups.setdefault(str(p.parent), []).append(p)
-
-        max_workers = self.config.get("max_workers", 6)
-
-        for folder_path, paths in groups.items():
-            self._folder_counters[folder_path] = 0
-
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as exe:
-                future_to_path = {exe.submit(self.analyzer.analyze, p): p for p in paths if p.exists()}
-
-                for future in concurrent.futures.as_completed(future_to_path):
-                    p = future_to_path[future]
-                    try:
-                        info = future.result()
-                        info["folder"] = Path(folder_path).name
-                        self.info[str(p)] = info
-
-                        # 线程安全地更新 UI
-                        preview_name = self._build_preview_name_from_info(info, 1, folder_path)
-                        QMetaObject.invokeMethod(
-                            self, "_update_tree_item",
-                            Qt.ConnectionType.QueuedConnection,
-                            Q_ARG(str, str(p)),
-                            Q_ARG(str, preview_name)
-                        )
-                    except Exception as e:
-                        error_msg = f"分析失败 {p.name}: {e}"
-                        QMetaObject.invokeMethod(
-                            self, "_append_log",
-                            Qt.ConnectionType.QueuedConnection,
-                            Q_ARG(str, error_msg)
-                        )
-
+            self._folder_counters[str(p.parent)] = 0
+
+        # 内容去重：相同内容只分析一次，结果分发给所有副本
+        content_groups = group_by_content([p for p in self.files if p.exists()])
+        self.duplicates = [g for g in content_groups.values() if len(g) > 1]
+        if self.duplicates:
+            extra = sum(len(g) - 1 for g in self.duplicates)
+            QMetaObject.invokeMethod(
+                self, "_append_log",
+                Qt.ConnectionType.QueuedConnection,
+                Q_ARG(str, f"发现 {len(self.duplicates)} 组重复文件，跳过 {extra} 个副本的重复分析")
+            )
+
+        # 本地分析服务在运行时交给它（共享预热线程池与结果缓存），否则在本进程内分析
+        pending = list(content_groups)
+        client = AnalysisClient(self.config.get("daemon_socket") or DEFAULT_SOCKET)
+        if client.available():
+            QMetaObject.invokeMethod(
+                self, "_append_log",
+                Qt.ConnectionType.QueuedConnection,
+                Q_ARG(str, "使用本地分析服务")
+            )
+            pending = self._analysis_via_service(client, content_groups)
+
+        # 两级管线：I/O 线程按磁盘顺序预读文件，解码线程从内存分析
+        # I/O 并行度与解码并发数分别自适应；每个解码任务占用一个预读槽位，
+        # 所以两者都不可能超过 read_ahead_depth，上限据此收紧
+        if pending:
+            depth = self.config.get("read_ahead_depth", 16)
+            io_tuner = self._make_tuner("io", pending[0], initial=self.config.get("io_workers", 2), hi=depth)
+            tuner = self._make_tuner("analysis", pending[0], hi=depth)
+            reader = ReadAhead(pending, depth=depth,
+                               budget_mb=self.config.get("read_ahead_mb", 256),
+                               io_tuner=io_tuner)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=tuner.hi) as exe:
+                for rep, data in reader:
+                    tuner.acquire()
+                    exe.submit(self._analyze_one, reader, tuner, rep, data, content_groups[rep])
+            tuner.save()
+            io_tuner.save()
+
+        QMetaObject.invokeMethod(self, "_refresh_thumbs", Qt.ConnectionType.QueuedConnection)
         QMetaObject.invokeMethod(
             self, "_append_log",
             Qt.ConnectionType.QueuedConnection,
             Q_ARG(str, "AI 分析全部完成")
         )
 
+    def _analysis_via_service(self, client, content_groups):
+        """通过分析服务分析各代表文件；返回未完成（服务中断）的代表文件列表"""
+        remaining = {str(p.resolve()): p for p in content_groups}
+        try:
+            for path, info, error in client.analyze(list(remaining)):
+                rep = remaining.pop(path, None)
+                if rep is None:
+                    continue
+                if error:
+                    QMetaObject.invokeMethod(
+                        self, "_append_log",
+                        Qt.ConnectionType.QueuedConnection,
+                        Q_ARG(str, f"分析失败 {rep.name}: {error}")
+                    )
+                    continue
+                self._store_result(rep, info, content_groups[rep])
+        except (OSError, ValueError) as e:
+            QMetaObject.invokeMethod(
+                self, "_append_log",
+                Qt.ConnectionType.QueuedConnection,
+                Q_ARG(str, f"分析服务中断，剩余 {len(remaining)} 个文件改为本地分析: {e}")
+            )
+        return list(remaining.values())
+
+    def import_results(self):
+        """导入一个或多个分片（或已合并的）结果文件，相对路径按当前文件夹还原"""
+        paths, _ = QFileDialog.getOpenFileNames(self, "导入分析结果", "", "分析结果 (*.rns)")
+        if not paths: return
+        try:
+            records, missing = merge_shards(paths, root=self.config.get("last_folder", ""))
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "错误", f"导入失败: {e}")
+            return
+        self.info.update(records)
+        self.log.append(f"已导入 {len(records)} 条分析结果")
+        if missing:
+            self.log.append(f"警告：缺少分片 {missing}")
+        self.preview_names()
+
+    def export_results(self):
+        if not self.info:
+            QMessageBox.warning(self, "错误", "没有可导出的分析结果")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "导出分析结果", "", "分析结果 (*.rns)")
+        if not path: return
+        try:
+            skipped = write_shard(path, self.info, root=self.config.get("last_folder", ""))
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "错误", f"导出失败: {e}")
+            return
+        self.log.append(f"分析结果已导出：{path}")
+        if skipped:
+            self.log.append(f"警告：{len(skipped)} 个文件不在当前文件夹下，未导出")
+
+    def _make_tuner(self, kind, path, initial=None, hi=None):
+        """按 path 所在存储根创建并发调节器；关闭 autotune 时固定为初始值（默认 max_workers）"""
+        n = initial or self.config.get("max_workers", 4)
+        if hi:
+            n = min(n, hi)
+        root = storage_root(path)
+        if not self.config.get("autotune", True):
+            return WorkerTuner(kind, root, initial=n, lo=n, hi=n)
+        return WorkerTuner(kind, root, initial=n, hi=hi, store=AUTOTUNE_PATH)
+
+    def _analyze_one(self, reader, tuner, rep, data, copies):
+        """解码线程：分析一份唯一内容并把结果分发给所有副本"""
+        try:
+            result = self.analyzer.analyze(rep, data=data)
+        except Exception as e:
+            error_msg = f"分析失败 {rep.name}: {e}"
+            QMetaObject.invokeMethod(
+                self, "_append_log",
+                Qt.ConnectionType.QueuedConnection,
+                Q_ARG(str, error_msg)
+            )
+            return
+        finally:
+            del data
+            reader.release(rep)
+            tuner.release()
+        self._store_result(rep, result, copies)
+
+    def _store_result(self, rep, result, copies):
+        """把一份唯一内容的分析结果分发给所有副本并刷新界面"""
+        for path_str, info in fan_out(self.analyzer, rep, result, copies).items():
+            self.info[path_str] = info
+
+            # 线程安全地更新 UI
+            preview_name = self._build_preview_name_from_info(info, 1, str(Path(path_str).parent))
+            QMetaObject.invokeMethod(
+                self, "_update_tree_item",
+                Qt.ConnectionType.QueuedConnection,
+                Q_ARG(str, path_str),
+                Q_ARG(str, preview_name)
+            )
+
     @pyqtSlot(str, str)
     def _update_tree_item(self, path_str: str, preview: str):
         """由主线程调用，安全更新预览列"""
@@ -334,6 +480,48 @@ class RenamerWindow(QMainWindow):
         """由主线程调用，安全追加日志"""
         self.log.append(text)
 
+    # ==============================================================
+    # 缩略图（可见行懒加载）
+    # ==============================================================
+    @pyqtSlot()
+    def _refresh_thumbs(self):
+        """合并短时间内的多次刷新请求（滚动、扫描、后台生成完成）"""
+        self._thumb_timer.start()
+
+    def _fill_visible_thumbs(self):
+        height = self.tree.viewport().height()
+        it = self.tree.itemAt(0, 0)
+        while it is not None and self.tree.visualItemRect(it).top() < height:
+            if it.icon(THUMB_COL).isNull():
+                path_str = it.data(0, Qt.ItemDataRole.UserRole)
+                # 内容相同的副本共用代表文件的缩略图
+                key = self.info.get(path_str, {}).get("dup_of") or path_str
+                img = self.thumb_cache.get(key)
+                if img is not None:
+                    it.setIcon(THUMB_COL, self._to_icon(img))
+                elif key not in self._thumb_pending:
+                    self._thumb_pending.add(key)
+                    self._thumb_pool.submit(self._make_thumb, key)
+            it = self.tree.itemBelow(it)
+
+    def _make_thumb(self, path_str):
+        """后台线程：为尚未分析的文件生成缩略图并写入缓存"""
+        try:
+            with Image.open(path_str) as img:
+                img.draft("RGB", (self.thumb_cache.size, self.thumb_cache.size))
+                self.thumb_cache.put(path_str, img.convert("RGB"))
+        except Exception:
+            return
+        finally:
+            self._thumb_pending.discard(path_str)
+        QMetaObject.invokeMethod(self, "_refresh_thumbs", Qt.ConnectionType.QueuedConnection)
+
+    @staticmethod
+    def _to_icon(img):
+        data = img.tobytes()
+        qimg = QImage(data, img.width, img.height, img.width * 3, QImage.Format.Format_RGB888)
+        return QIcon(QPixmap.fromImage(qimg.copy()))
+
     # ==============================================================
     # 预览 & 执行
     # ==============================================================
@@ -400,6 +588,9 @@ class RenamerWindow(QMainWindow):
         self.rename_history = []
         copy_mode = self.chk_copy_mode.isChecked()
 
+        copy_jobs = []      # 复制模式下先规划目标名，再并发复制
+        reserved = set()
+
         for i in range(self.tree.topLevelItemCount()):
             it = self.tree.topLevelItem(i)
             src = Path(it.data(0, Qt.ItemDataRole.UserRole))
@@ -417,25 +608,56 @@ class RenamerWindow(QMainWindow):
             # 解决文件名冲突
             base, ext = Path(final_name).stem, Path(final_name).suffix
             i = 1
-            while dest.exists():
+            while dest.exists() or dest in reserved:
                 dest = src.parent / f"{base}_{i}{ext}"
                 i += 1
 
             if copy_mode:
-                shutil.copy2(src, dest)
-                self.rename_history.append((None, dest))
-            else:
-                old_path = src
-                src.rename(dest)
-                self.rename_history.append((old_path, dest))
+                reserved.add(dest)
+                copy_jobs.append((it, src, dest))
+                continue
+
+            old_path = src
+            src.rename(dest)
+            self.rename_history.append((old_path, dest))
 
             # 更新树视图（可选）
             it.setText(0, dest.name)
             it.setData(0, Qt.ItemDataRole.UserRole, str(dest))
 
+        if copy_jobs:
+            self._run_copies(copy_jobs)
+
         mode_str = "复制" if copy_mode else "重命名"
         self.log.append(f"执行{mode_str}完成")
 
+    def _run_copies(self, jobs):
+        """按自适应并发复制文件，完成后记录历史并更新树视图"""
+        tuner = self._make_tuner("copy", jobs[0][2])
+
+        def copy_one(src, dest):
+            try:
+                shutil.copy2(src, dest)
+            finally:
+                tuner.release()
+
+        futures = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=tuner.hi) as exe:
+            for it, src, dest in jobs:
+                tuner.acquire()
+                futures.append((it, src, dest, exe.submit(copy_one, src, dest)))
+        tuner.save()
+
+        for it, src, dest, fut in futures:
+            try:
+                fut.result()
+            except OSError as e:
+                self.log.append(f"复制失败 {src.name}: {e}")
+                continue
+            self.rename_history.append((None, dest))
+            it.setText(0, dest.name)
+            it.setData(0, Qt.ItemDataRole.UserRole, str(dest))
+
     def undo_all(self):
         for old, new in reversed(self.rename_history):
             if old is None:
@@ -483,6 +705,9 @@ class RenamerWindow(QMainWindow):
                     key = lambda x: x[1].get("brightness", 0.0)
                 elif "元素数量" in rule:
                     key = lambda x: x[1].get("object_count", 0)
+                elif "重复文件" in rule:
+                    # 副本数相同时按内容代表文件聚在一起
+                    key = lambda x: (x[1].get("dup_count", 1), x[1].get("dup_of") or str(x[0]))
                 elif "创建时间" in rule:
                     key = lambda x: x[0].stat().st_mtime
                 elif "文件名" in rule:
@@ -515,6 +740,7 @@ class RenamerWindow(QMainWindow):
             it = QTreeWidgetItem([p.name, str(p.parent), ""])
             it.setData(0, Qt.ItemDataRole.UserRole, str(p))
             self.tree.addTopLevelItem(it)
+        self._refresh_thumbs()
 
         self.log.append(f"排序完成：{', '.join(selected)}")
 
@@ -1,9 +1,175 @@
 ﻿import sys
-from PyQt6.QtWidgets import QApplication
-from gui import RenamerWindow
+import json
+import argparse
+
+from core.scanner import scan_folder
+from core.dedup import find_duplicates, format_report, group_by_content, fan_out
+from core.analyzer import Analyzer
+from core.service import AnalysisClient, DEFAULT_SOCKET, SUPPORTED
+from core import shards
+
+DEFAULT_EXTENSIONS = [".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tiff", ".gif"]
+
+
+def run_gui():
+    from PyQt6.QtWidgets import QApplication
+    from gui import RenamerWindow
 
-if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = RenamerWindow()
     window.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    return app.exec()
+
+
+def _scan(args):
+    exts = [e if e.startswith(".") else "." + e for e in (x.strip().lower() for x in args.ext.split(",")) if e]
+    return scan_folder(args.folder, exts, not args.no_recursive)
+
+
+def cmd_dupes(args):
+    """输出重复文件报告"""
+    files = _scan(args)
+    print(f"扫描完成，共 {len(files)} 个文件")
+    print(format_report(find_duplicates(files)))
+    return 0
+
+
+def cmd_serve(args):
+    """启动本地分析服务（前台运行，Ctrl+C 退出）"""
+    if not SUPPORTED:
+        print("错误：当前平台不支持 Unix socket，无法启动分析服务（GUI 与命令行会在本进程内分析）",
+              file=sys.stderr)
+        return 1
+    from core.service import AnalysisService
+
+    service = AnalysisService(args.socket, max_workers=args.workers)
+    print(f"分析服务已启动: {args.socket}")
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except (OSError, RuntimeError) as e:
+        print(f"错误：{e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_analyze(args):
+    """分析文件夹并逐行输出 JSON；分析服务在运行时交给服务，否则在本进程内分析"""
+    groups = group_by_content(_scan(args))
+    analyzer = Analyzer()
+
+    def emit(rep, info):
+        for path, out in fan_out(analyzer, rep, info, groups[rep]).items():
+            print(json.dumps({"path": path, **out}, ensure_ascii=False))
+
+    # 服务中断时，没拿到结果的代表文件改为本地分析
+    remaining = {str(p.resolve()): p for p in groups}
+    client = AnalysisClient(args.socket)
+    if client.available():
+        try:
+            for path, info, error in client.analyze(list(groups)):
+                rep = remaining.pop(path, None)
+                if rep is None:
+                    continue
+                if error:
+                    print(f"分析失败 {rep}: {error}", file=sys.stderr)
+                    continue
+                emit(rep, info)
+        except (OSError, ValueError) as e:
+            print(f"分析服务中断，剩余 {len(remaining)} 个文件改为本地分析: {e}", file=sys.stderr)
+
+    for rep in remaining.values():
+        emit(rep, analyzer.analyze(rep))
+    return 0
+
+
+def cmd_shard(args):
+    """分析一个分片；不指定 --index 时用本机多个进程模拟所有节点并合并"""
+    files = _scan(args)
+    skipped = shards.outside_root(files, args.folder)
+    for p in skipped:
+        print(f"跳过不在扫描根目录下的文件: {p}", file=sys.stderr)
+    try:
+        if args.index is None:
+            out = shards.run_local(args.folder, files, args.count, args.out, args.workers)
+            print(f"本地 {args.count} 个进程分析完成，合并结果: {out}")
+        else:
+            out = shards.run_shard(args.folder, files, args.index, args.count, args.out, args.workers)
+            print(f"分片 {args.index}/{args.count} 完成: {out}")
+    except (OSError, ValueError) as e:
+        print(f"错误：{e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_merge(args):
+    """合并多个分片文件"""
+    try:
+        records, missing = shards.merge_shards(args.shards, out=args.out)
+    except (OSError, ValueError) as e:
+        print(f"错误：{e}", file=sys.stderr)
+        return 1
+    print(f"已合并 {len(args.shards)} 个分片，共 {len(records)} 条结果: {args.out}")
+    if missing:
+        print(f"警告：缺少分片 {missing}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def _positive_int(text):
+    try:
+        n = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"不是整数: {text}")
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"必须 >= 1: {n}")
+    return n
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="RenamerAI", description="不带参数时启动图形界面")
+    sub = parser.add_subparsers(dest="command")
+
+    def add_scan_args(p):
+        p.add_argument("folder", help="图片文件夹")
+        p.add_argument("--ext", default=",".join(DEFAULT_EXTENSIONS), help="扩展名 (逗号分隔)")
+        p.add_argument("--no-recursive", action="store_true", help="不递归子文件夹")
+
+    p_dupes = sub.add_parser("dupes", help="列出内容完全相同的文件")
+    add_scan_args(p_dupes)
+    p_dupes.set_defaults(func=cmd_dupes)
+
+    p_analyze = sub.add_parser("analyze", help="分析图片并输出 JSON 行")
+    add_scan_args(p_analyze)
+    p_analyze.add_argument("--socket", default=DEFAULT_SOCKET, help="分析服务 socket 路径")
+    p_analyze.set_defaults(func=cmd_analyze)
+
+    p_shard = sub.add_parser("shard", help="分片分析（多机协作）")
+    add_scan_args(p_shard)
+    p_shard.add_argument("--count", type=_positive_int, required=True, help="分片总数")
+    p_shard.add_argument("--index", type=int, help="本机负责的分片序号（0 起）；省略则本机多进程跑全部分片")
+    p_shard.add_argument("--workers", type=_positive_int, default=4, help="每个分片的分析线程数")
+    p_shard.add_argument("-o", "--out", default="shards", help="分片输出目录")
+    p_shard.set_defaults(func=cmd_shard)
+
+    p_merge = sub.add_parser("merge", help="合并分片文件")
+    p_merge.add_argument("shards", nargs="+", help="分片文件 (.rns)")
+    p_merge.add_argument("-o", "--out", default="merged.rns", help="合并输出文件")
+    p_merge.set_defaults(func=cmd_merge)
+
+    p_serve = sub.add_parser("serve", help="启动本地分析服务（GUI 与命令行共享）")
+    p_serve.add_argument("--socket", default=DEFAULT_SOCKET, help="监听的 socket 路径")
+    p_serve.add_argument("--workers", type=_positive_int, default=6, help="分析线程数")
+    p_serve.set_defaults(func=cmd_serve)
+    return parser
+
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.command == "shard" and args.index is not None and not 0 <= args.index < args.count:
+        parser.error(f"--index 必须在 0..{args.count - 1} 之间")
+    if args.command is None:
+        sys.exit(run_gui())
+    sys.exit(args.func(args))
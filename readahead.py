@@ -0,0 +1,110 @@
+﻿# core/readahead.py
+"""
+ReadAhead：把磁盘读取与 CPU 解码分离的预读管线。
+ - 专用 I/O 线程按磁盘（inode）顺序读取整个文件到内存
+ - 有界缓冲池：同时在途的文件数不超过 depth，总字节数不超过 budget_mb
+   （单个文件超过预算时只在缓冲池为空时读取，保证不会卡死）
+ - 消费方（解码线程）用 io.BytesIO(data) 从内存打开图片；
+   BytesIO 直接共享 bytes 的缓冲区，不会再复制一次
+每个取出的条目处理完后必须调用 release(path) 归还缓冲槽位。
+传入 io_tuner（WorkerTuner）时，I/O 线程按其上限创建，同时读取的文件数由它动态调整；
+否则固定为 io_workers 个线程。
+"""
+import os
+import queue
+import threading
+from pathlib import Path
+
+
+def sort_by_inode(paths: list[Path]) -> list[Path]:
+    """
+    按 (设备, inode) 排序，近似文件在磁盘上的物理顺序，减少机械盘寻道。
+    无法 stat 或平台不提供 inode（st_ino 为 0）的文件保持原有相对顺序。
+    """
+    def key(p):
+        try:
+            st = os.stat(p)
+            return (st.st_dev, st.st_ino)
+        except OSError:
+            return (0, 0)
+    return sorted(paths, key=key)
+
+
+class ReadAhead:
+    def __init__(self, paths: list[Path], depth: int = 16, io_workers: int = 2, budget_mb: int = 256,
+                 io_tuner=None):
+        self.paths = sort_by_inode([Path(p) for p in paths])
+        self.depth = max(1, int(depth))
+        self.io_tuner = io_tuner
+        self.io_workers = io_tuner.hi if io_tuner is not None else max(1, int(io_workers))
+        self.budget = max(1, int(budget_mb)) * 1024 * 1024
+        self._pool = threading.Condition()
+        self._in_flight = {}            # {path: 字节数} 已读出、尚未归还的缓冲
+        self._ready = queue.Queue()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def _take(self):
+        with self._lock:
+            if self._next >= len(self.paths):
+                return None
+            p = self.paths[self._next]
+            self._next += 1
+            return p
+
+    def _reserve(self, p, size):
+        """等到缓冲池放得下 size 字节；停止时返回 False"""
+        with self._pool:
+            while (self._in_flight and (len(self._in_flight) >= self.depth
+                                        or sum(self._in_flight.values()) + size > self.budget)):
+                if self._stop.is_set():
+                    return False
+                self._pool.wait(timeout=0.2)
+            self._in_flight[p] = size
+            return True
+
+    def _io_loop(self):
+        while not self._stop.is_set():
+            p = self._take()
+            if p is None:
+                return
+            try:
+                size = os.stat(p).st_size
+            except OSError:
+                size = 0
+            if not self._reserve(p, size):
+                return
+            if self.io_tuner is not None:
+                self.io_tuner.acquire()
+            try:
+                with open(p, "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            finally:
+                if self.io_tuner is not None:
+                    self.io_tuner.release()
+            self._ready.put((p, data))
+
+    def __iter__(self):
+        """依次产出 (path, bytes | None)；读取失败时 data 为 None"""
+        threads = [threading.Thread(target=self._io_loop, daemon=True) for _ in range(self.io_workers)]
+        for t in threads:
+            t.start()
+        try:
+            for _ in range(len(self.paths)):
+                yield self._ready.get()
+        finally:
+            self.close()
+
+    def release(self, path):
+        """归还 path 占用的缓冲（每个产出的条目调用一次）"""
+        with self._pool:
+            self._in_flight.pop(Path(path), None)
+            self._pool.notify_all()
+
+    def close(self):
+        self._stop.set()
+        with self._pool:
+            self._pool.notify_all()
@@ -0,0 +1,204 @@
+﻿# core/service.py
+"""
+本地分析服务：常驻进程保持预热的线程池与结果缓存，GUI / 命令行通过 Unix socket 提交任务。
+协议：每行一个 JSON
+  请求  {"op": "ping"}                         -> {"ok": true}
+        {"op": "analyze", "paths": [...]}       -> 每完成一个返回 {"path": ..., "info": {...}}
+                                                   （失败时为 {"path": ..., "error": "..."}），
+                                                   最后返回 {"done": true}
+同一文件（路径 + mtime + 大小）只分析一次：命中缓存直接返回，正在分析的请求共享同一个任务。
+socket 放在当前用户独占的目录（$XDG_RUNTIME_DIR 或临时目录下的 renamerai-<uid>，权限 0700），
+socket 本身权限 0600；客户端只连接属于当前用户的 socket。
+不支持 Unix socket 的平台（如 Windows）上模块仍可导入，客户端视为服务未运行，服务端无法启动。
+"""
+import concurrent.futures
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from core.analyzer import Analyzer
+
+SUPPORTED = hasattr(socket, "AF_UNIX")
+
+
+def _user_runtime_dir() -> str:
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "renamerai")
+    if not hasattr(os, "getuid"):
+        # Windows 的临时目录本身按用户区分
+        return os.path.join(tempfile.gettempdir(), "renamerai")
+    return os.path.join(tempfile.gettempdir(), f"renamerai-{os.getuid()}")
+
+
+DEFAULT_SOCKET = os.path.join(_user_runtime_dir(), "analysis.sock")
+
+
+def _owned_by_me(path) -> bool:
+    """path 属于当前用户（无 uid 概念的平台上恒为 True）"""
+    if not hasattr(os, "getuid"):
+        return True
+    return os.stat(path).st_uid == os.getuid()
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return (str(path), st.st_mtime_ns, st.st_size)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        service = self.server.service
+        for line in self.rfile:
+            try:
+                req = json.loads(line)
+            except ValueError:
+                self._send({"error": "bad request"})
+                continue
+            op = req.get("op")
+            if op == "ping":
+                self._send({"ok": True})
+            elif op == "analyze":
+                for path, info, error in service.analyze_iter(req.get("paths", [])):
+                    self._send({"path": path, "error": error} if error else {"path": path, "info": info})
+                self._send({"done": True})
+            else:
+                self._send({"error": f"unknown op: {op}"})
+
+    def _send(self, obj):
+        self.wfile.write(json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+
+if SUPPORTED:
+    class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+class AnalysisService:
+    def __init__(self, socket_path=DEFAULT_SOCKET, max_workers=6, cache_size=200000):
+        self.socket_path = str(socket_path)
+        self.analyzer = Analyzer()
+        self.cache_size = cache_size
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        # 可重入：任务若在登记回调前已完成，回调会在持锁的当前线程里立即执行
+        self._lock = threading.RLock()
+        self._cache = OrderedDict()     # {stamp: info}
+        self._inflight = {}             # {stamp: Future}
+        self._server = None
+
+    def _submit(self, path):
+        """返回该文件的 Future：命中缓存 / 正在分析时复用，否则新建任务"""
+        key = _stamp(path)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                fut = concurrent.futures.Future()
+                fut.set_result(self._cache[key])
+                return fut
+            fut = self._inflight.get(key)
+            if fut is None:
+                fut = self._pool.submit(self.analyzer.analyze, Path(path))
+                self._inflight[key] = fut
+                fut.add_done_callback(lambda f, k=key: self._finish(k, f))
+            return fut
+
+    def _finish(self, key, fut):
+        with self._lock:
+            self._inflight.pop(key, None)
+            if fut.exception() is None:
+                self._cache[key] = fut.result()
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+    def analyze_iter(self, paths):
+        """按完成顺序产出 (path, info, error)"""
+        futures = {}
+        for path in paths:
+            try:
+                futures[self._submit(path)] = path
+            except OSError as e:
+                yield path, None, str(e)
+        for fut in concurrent.futures.as_completed(futures):
+            try:
+                yield futures[fut], dict(fut.result()), None
+            except Exception as e:
+                yield futures[fut], None, str(e)
+
+    def _prepare_dir(self):
+        """创建/检查 socket 所在目录：必须属于当前用户且其他人不可访问"""
+        parent = os.path.dirname(os.path.abspath(self.socket_path))
+        os.makedirs(parent, mode=0o700, exist_ok=True)
+        st = os.stat(parent)
+        if not _owned_by_me(parent) or st.st_mode & 0o077:
+            raise RuntimeError(f"socket 目录不安全（需属于当前用户且权限为 0700）: {parent}")
+
+    def serve_forever(self):
+        if not SUPPORTED:
+            raise RuntimeError("当前平台不支持 Unix socket，无法启动分析服务")
+        self._prepare_dir()
+        # 清理上次异常退出留下的 socket 文件（确认没有服务在监听）
+        if os.path.exists(self.socket_path):
+            if AnalysisClient(self.socket_path).available():
+                raise RuntimeError(f"分析服务已在运行: {self.socket_path}")
+            os.unlink(self.socket_path)
+        self._server = _Server(self.socket_path, _Handler)
+        os.chmod(self.socket_path, 0o600)
+        self._server.service = self
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+
+class AnalysisClient:
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=1.0):
+        self.socket_path = str(socket_path)
+        self.timeout = timeout
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def available(self) -> bool:
+        """服务是否在运行（平台不支持 Unix socket 时返回 False）"""
+        if not SUPPORTED or not os.path.exists(self.socket_path):
+            return False
+        try:
+            # 只信任当前用户自己启动的服务，防止他人抢先创建同名 socket 伪造结果
+            if not _owned_by_me(self.socket_path):
+                return False
+            with self._connect() as sock:
+                sock.sendall(b'{"op": "ping"}\n')
+                return json.loads(sock.makefile("rb").readline()).get("ok", False)
+        except (OSError, ValueError):
+            return False
+
+    def analyze(self, paths):
+        """
+        提交一批文件并按完成顺序产出 (path, info, error)。
+        路径统一转为绝对路径，服务进程的工作目录可能不同。
+        """
+        paths = [str(Path(p).resolve()) for p in paths]
+        with self._connect() as sock:
+            sock.settimeout(None)   # 大批量分析耗时不定，连上后不再超时
+            sock.sendall(json.dumps({"op": "analyze", "paths": paths}, ensure_ascii=False).encode("utf-8") + b"\n")
+            for line in sock.makefile("rb"):
+                msg = json.loads(line)
+                if msg.get("done"):
+                    return
+                yield msg.get("path"), msg.get("info"), msg.get("error")
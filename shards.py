@@ -0,0 +1,296 @@
+﻿# core/shards.py
+"""
+分片分析：把超大图库按相对路径确定性地切分给多台机器分析，结果写成紧凑的列式二进制分片，
+最后合并到一处统一排序和重命名。
+ - 分片归属由相对路径（posix 形式）的哈希决定，与挂载位置、扫描顺序、机器系统无关；
+   相对路径按字面计算、不解析符号链接，不在扫描根目录下的文件会被跳过
+ - 分片文件格式（.rns）：
+     MAGIC | 头部长度(uint32 LE) | 头部 JSON | 各列 zlib 压缩数据
+   头部记录 shards（覆盖的分片序号，合并文件为多个）/ count（原始分片总数）/ rows / 字节序
+   以及每列的 name / type / offset / length
+   列类型：i8（整数）、f8（浮点）、str（UTF-8，以 \\0 分隔）、json（每行一个 JSON，以 \\0 分隔）
+"""
+import concurrent.futures
+import hashlib
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+from pathlib import Path
+
+from core.analyzer import Analyzer
+from core.dedup import group_by_content, fan_out, content_hash
+
+MAGIC = b"RNSHARD1"
+SUFFIX = ".rns"
+
+
+def rel_key(path, root):
+    """path 相对 root 的 posix 路径；不在 root 下（或跨盘符）时返回 None"""
+    try:
+        rel = os.path.relpath(path, root)
+    except ValueError:
+        return None
+    if rel == os.pardir or rel.startswith(os.pardir + os.sep) or os.path.isabs(rel):
+        return None
+    return Path(rel).as_posix()
+
+
+def outside_root(paths, root) -> list[Path]:
+    """不在 root 下、无法参与分片的文件"""
+    return [Path(p) for p in paths if rel_key(p, root) is None]
+
+
+def shard_of(rel: str, count: int) -> int:
+    digest = hashlib.blake2b(rel.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count
+
+
+def select_shard(paths: list[Path], root, index: int, count: int) -> list[Path]:
+    """取出属于第 index 个分片（共 count 个）的文件，按相对路径排序；不在 root 下的文件跳过"""
+    if not 0 <= index < count:
+        raise ValueError(f"分片序号越界: {index}/{count}")
+    picked = sorted((rel, Path(p)) for p in paths if (rel := rel_key(p, root)) is not None)
+    return [p for rel, p in picked if shard_of(rel, count) == index]
+
+
+def shard_name(index: int, count: int) -> str:
+    return f"shard-{index:04d}-of-{count:04d}{SUFFIX}"
+
+
+def analyze_files(paths: list[Path], workers: int = 4) -> dict[str, dict]:
+    """
+    在本进程内分析（含内容去重），返回 {str(path): info}，字段与 GUI 中一致。
+    另外记录 content_hash，合并时据此在所有分片之间重新识别重复文件。
+    """
+    analyzer = Analyzer()
+    groups = group_by_content(paths)
+
+    def analyze_one(p):
+        info = analyzer.analyze(p)
+        try:
+            info["content_hash"] = content_hash(p)
+        except OSError:
+            info["content_hash"] = ""
+        return info
+
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as exe:
+        future_to_path = {exe.submit(analyze_one, p): p for p in groups}
+        for future in concurrent.futures.as_completed(future_to_path):
+            rep = future_to_path[future]
+            results.update(fan_out(analyzer, rep, future.result(), groups[rep]))
+    return results
+
+
+def _rebuild_duplicates(records: dict[str, dict]):
+    """
+    按 content_hash 在全部记录（相对路径为键）之间重新计算 dup_count / dup_of：
+    分片内去重看不到其他分片里的副本。代表文件取相对路径最小者。
+    没有 content_hash 的记录（如 GUI 导出）保持原样。
+    """
+    by_hash = {}
+    for rel in sorted(records):
+        h = records[rel].get("content_hash")
+        if h:
+            by_hash.setdefault(h, []).append(rel)
+    for rels in by_hash.values():
+        rep = rels[0]
+        for rel in rels:
+            records[rel]["dup_count"] = len(rels)
+            records[rel]["dup_of"] = rep if rel != rep else ""
+
+
+# ==============================================================
+# 列式编码
+# ==============================================================
+def _column_type(values):
+    if all(isinstance(v, bool) for v in values):
+        return "json"
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return "i8"
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return "f8"
+    if all(isinstance(v, str) and "\0" not in v for v in values):
+        return "str"
+    return "json"
+
+
+def _encode(ctype, values) -> bytes:
+    if ctype == "i8":
+        raw = array("q", values).tobytes()
+    elif ctype == "f8":
+        raw = array("d", (float(v) for v in values)).tobytes()
+    elif ctype == "str":
+        raw = "\0".join(values).encode("utf-8")
+    else:
+        raw = "\0".join(json.dumps(v, ensure_ascii=False) for v in values).encode("utf-8")
+    return zlib.compress(raw, 6)
+
+
+def _decode(ctype, blob, rows, byteorder):
+    raw = zlib.decompress(blob)
+    if ctype in ("i8", "f8"):
+        arr = array("q" if ctype == "i8" else "d")
+        arr.frombytes(raw)
+        if byteorder != sys.byteorder:
+            arr.byteswap()
+        return arr.tolist()
+    parts = raw.decode("utf-8").split("\0") if rows else []
+    if ctype == "str":
+        return parts
+    return [json.loads(s) for s in parts]
+
+
+def write_shard(out, records: dict[str, dict], root=None, index: int = 0, count: int = 1,
+                shards: list[int] = None) -> list[str]:
+    """
+    把分析结果写成分片文件；路径（含 dup_of）存为相对扫描根目录的 posix 路径。
+
+    Args:
+        out: 输出文件路径
+        records (dict): {绝对路径: info}；root 为 None 时键与 dup_of 已是相对路径
+        root: 扫描根目录
+        index, count (int): 本分片序号与分片总数
+        shards (list[int]): 文件覆盖的分片序号（合并文件用），默认为 [index]
+
+    Returns:
+        list[str]: 不在 root 下而被跳过的路径
+    """
+    rows, skipped = [], []
+    for path, info in records.items():
+        row = dict(info)
+        if root is not None:
+            row["rel"] = rel_key(path, root)
+            if row["rel"] is None:
+                skipped.append(path)
+                continue
+            if row.get("dup_of"):
+                row["dup_of"] = rel_key(row["dup_of"], root) or ""
+        else:
+            row["rel"] = path
+        rows.append(row)
+    rows.sort(key=lambda r: r["rel"])
+
+    names = sorted({k for r in rows for k in r})
+    columns, blobs, offset = [], [], 0
+    for name in names:
+        values = [r.get(name) for r in rows]
+        ctype = _column_type(values) if all(name in r for r in rows) else "json"
+        blob = _encode(ctype, values)
+        columns.append({"name": name, "type": ctype, "offset": offset, "length": len(blob)})
+        blobs.append(blob)
+        offset += len(blob)
+
+    header = json.dumps({
+        "shards": sorted(shards) if shards is not None else [index], "count": count, "rows": len(rows),
+        "byteorder": sys.byteorder, "columns": columns,
+    }, ensure_ascii=False).encode("utf-8")
+    out = Path(out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    # 先写临时文件再替换，节点中途退出不会留下截断的分片
+    tmp = out.with_name(out.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp, out)
+    return skipped
+
+
+def read_shard(path) -> tuple[dict, dict[str, dict]]:
+    """读取分片文件，返回 (头部, {相对路径: info})；文件损坏时抛出 ValueError"""
+    data = Path(path).read_bytes()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"不是分片文件: {path}")
+    try:
+        return _parse_shard(data)
+    except (struct.error, zlib.error, KeyError, IndexError, TypeError, ValueError) as e:
+        raise ValueError(f"损坏的分片文件 {path}: {e}") from e
+
+
+def _parse_shard(data: bytes):
+    pos = len(MAGIC)
+    (hlen,) = struct.unpack_from("<I", data, pos)
+    pos += 4
+    if pos + hlen > len(data):
+        raise ValueError("头部不完整")
+    header = json.loads(data[pos:pos + hlen].decode("utf-8"))
+    pos += hlen
+
+    rows = header["rows"]
+    cols = {}
+    for c in header["columns"]:
+        end = pos + c["offset"] + c["length"]
+        if end > len(data):
+            raise ValueError(f"列 {c['name']} 数据不完整")
+        cols[c["name"]] = _decode(c["type"], data[pos + c["offset"]:end], rows, header["byteorder"])
+        if len(cols[c["name"]]) != rows:
+            raise ValueError(f"列 {c['name']} 行数不符")
+
+    records = {}
+    for i in range(rows):
+        info = {name: values[i] for name, values in cols.items() if values[i] is not None}
+        records[info.pop("rel")] = info
+    return header, records
+
+
+def merge_shards(paths, root=None, out=None) -> tuple[dict[str, dict], list[int]]:
+    """
+    合并多个分片。
+
+    Args:
+        paths: 分片文件列表（也可以是已合并的文件，可与剩余分片继续合并）
+        root: 给出时把相对路径还原为 root 下的绝对路径（含 dup_of）
+        out: 给出时把合并结果写成一个文件，头部保留原始分片总数与已覆盖的分片序号
+
+    Returns:
+        (records, missing): 合并后的结果，以及缺失的分片序号
+    """
+    merged, seen, count = {}, set(), None
+    for path in paths:
+        header, records = read_shard(path)
+        if count is None:
+            count = header["count"]
+        elif header["count"] != count:
+            raise ValueError(f"分片总数不一致: {path} 为 {header['count']}，应为 {count}")
+        seen.update(header["shards"])
+        merged.update(records)
+    missing = sorted(set(range(count or 0)) - seen)
+    _rebuild_duplicates(merged)
+    if out is not None:
+        write_shard(out, merged, index=None, count=count or 1, shards=sorted(seen))
+
+    if root is not None:
+        base = Path(root)
+        restored = {}
+        for rel, info in merged.items():
+            if info.get("dup_of"):
+                info["dup_of"] = str(base / info["dup_of"])
+            restored[str(base / rel)] = info
+        merged = restored
+    return merged, missing
+
+
+def run_shard(folder, paths, index: int, count: int, out_dir, workers: int = 4) -> Path:
+    """分析一个分片并写出分片文件（一台机器 / 一个进程的工作）"""
+    picked = select_shard(paths, folder, index, count)
+    out = Path(out_dir) / shard_name(index, count)
+    write_shard(out, analyze_files(picked, workers), folder, index, count)
+    return out
+
+
+def run_local(folder, paths, count: int, out_dir, workers: int = 4) -> Path:
+    """
+    用本机的 count 个进程模拟多台机器：各自分析一个分片，再合并为 merged.rns
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=count) as exe:
+        futures = [exe.submit(run_shard, folder, paths, i, count, out_dir, workers) for i in range(count)]
+        shard_files = [f.result() for f in futures]
+    out = Path(out_dir) / f"merged{SUFFIX}"
+    merge_shards(shard_files, out=out)
+    return out
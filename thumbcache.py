@@ -0,0 +1,153 @@
+﻿# core/thumbcache.py
+"""
+ThumbCache：磁盘缓存的缩略图（按容量上限做 LRU 淘汰）
+ - 缩略图以 RGB 原始像素存放在固定大小的槽位里，多个槽位打包进一个图集文件（atlas_N.bin），
+   通过 mmap 读写，避免产生海量小文件
+ - 每个图集最多 SLOTS_PER_ATLAS 个槽位，且所有图集的槽位总数不超过容量上限，磁盘占用严格受 max_mb 约束
+ - 索引 index.json 记录 {路径: [图集号, 槽位, w, h, mtime_ns, size]}，顺序即 LRU 顺序
+ - 文件修改（mtime / 大小变化）后旧缩略图自动失效
+"""
+import json
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from PIL import Image
+
+SLOTS_PER_ATLAS = 1024
+
+
+class ThumbCache:
+    def __init__(self, root, max_mb: int = 512, size: int = 96):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.size = size
+        self.slot_bytes = size * size * 3
+        self.max_slots = max(1, max_mb * 1024 * 1024 // self.slot_bytes)
+        self.per_atlas = min(SLOTS_PER_ATLAS, self.max_slots)
+        self._lock = threading.Lock()
+        self._atlases = {}              # {图集号: (file, mmap)}
+        self._index = OrderedDict()     # {str(path): [atlas, slot, w, h, mtime_ns, size]}
+        self._free = []                 # 已淘汰/失效、可复用的全局槽位号
+        self._load_index()
+
+    # -------------------- 索引 --------------------
+    @property
+    def _index_path(self):
+        return self.root / "index.json"
+
+    def _load_index(self):
+        try:
+            data = json.loads(self._index_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if data.get("size") != self.size or data.get("per_atlas") != self.per_atlas:
+            return
+        for key, entry in data.get("entries", []):
+            # 容量调小后，超出新上限的槽位直接丢弃
+            if self._slot_no(entry) < self.max_slots:
+                self._index[key] = entry
+        # 重新计算空闲槽位：已分配范围内没被占用的都可复用
+        used = {self._slot_no(e) for e in self._index.values()}
+        top = max(used) + 1 if used else 0
+        self._free = [n for n in range(top) if n not in used]
+        while len(self._index) > self.max_slots:
+            self._evict()
+
+    def flush(self):
+        """把索引写回磁盘（窗口关闭时调用）"""
+        with self._lock:
+            data = {"size": self.size, "per_atlas": self.per_atlas,
+                    "entries": list(self._index.items())}
+            for _, mm in self._atlases.values():
+                mm.flush()
+        tmp = self._index_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, self._index_path)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            for f, mm in self._atlases.values():
+                mm.close()
+                f.close()
+            self._atlases.clear()
+
+    # -------------------- 槽位 --------------------
+    def _slot_no(self, entry):
+        return entry[0] * self.per_atlas + entry[1]
+
+    def _atlas(self, no):
+        if no not in self._atlases:
+            path = self.root / f"atlas_{no}.bin"
+            f = open(path, "a+b")
+            # 最后一个图集只按剩余容量分配，保证总大小不超过 max_slots 个槽位
+            slots = min(self.per_atlas, self.max_slots - no * self.per_atlas)
+            total = slots * self.slot_bytes
+            if os.fstat(f.fileno()).st_size != total:
+                f.truncate(total)
+            self._atlases[no] = (f, mmap.mmap(f.fileno(), total))
+        return self._atlases[no][1]
+
+    def _evict(self):
+        _, entry = self._index.popitem(last=False)
+        self._free.append(self._slot_no(entry))
+
+    def _alloc(self):
+        if len(self._index) >= self.max_slots:
+            self._evict()
+        if self._free:
+            return self._free.pop()
+        return len(self._index) + len(self._free)
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    # -------------------- 读写 --------------------
+    def get(self, path):
+        """取缩略图（PIL RGB Image），未命中或已失效返回 None"""
+        key = str(path)
+        stamp = self._stamp(path)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            if stamp is None or tuple(entry[4:6]) != stamp:
+                del self._index[key]
+                self._free.append(self._slot_no(entry))
+                return None
+            self._index.move_to_end(key)
+            atlas, slot, w, h = entry[:4]
+            off = slot * self.slot_bytes
+            raw = self._atlas(atlas)[off:off + w * h * 3]
+        return Image.frombytes("RGB", (w, h), raw)
+
+    def put(self, path, img: Image.Image):
+        """存入缩略图；img 可以是任意尺寸，会等比缩小到 size 以内"""
+        stamp = self._stamp(path)
+        if stamp is None:
+            return
+        thumb = img.convert("RGB")
+        if thumb.width > self.size or thumb.height > self.size:
+            thumb = thumb.copy()
+            thumb.thumbnail((self.size, self.size))
+        w, h = thumb.size
+        raw = thumb.tobytes()
+        key = str(path)
+        with self._lock:
+            old = self._index.pop(key, None)
+            if old is not None:
+                n = self._slot_no(old)
+            else:
+                n = self._alloc()
+            atlas, slot = divmod(n, self.per_atlas)
+            off = slot * self.slot_bytes
+            self._atlas(atlas)[off:off + len(raw)] = raw
+            self._index[key] = [atlas, slot, w, h, *stamp]